@@ -5,25 +5,28 @@ Fully updated to fix Pillow ANTIALIAS and Excel column issues.
 """
 
 import os
-import math
 import glob
+import hashlib
 import time
 import tempfile
 import random
+import shutil
+import socket
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+import cv2
 import pandas as pd
-from PIL import Image, ImageDraw, ImageFont
+from openpyxl import load_workbook
+from PIL import ImageFont
 from gtts import gTTS
-from moviepy.editor import (
-    VideoFileClip,
-    ImageClip,
-    AudioFileClip,
-    CompositeVideoClip,
-    concatenate_videoclips,
-)
 import requests
+import httplib2
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 
@@ -32,6 +35,7 @@ WIDTH = 1080
 HEIGHT = 1920
 ASSETS_DIR = Path("assets")
 BG_VIDEO_GLOB = ASSETS_DIR / "backgrounds" / "*.mp4"
+BG_CACHE_DIR = ASSETS_DIR / "backgrounds" / ".cache"
 BG_IMAGE = ASSETS_DIR / "bg.jpg"
 MUSIC_GLOB = ASSETS_DIR / "music" / "*.mp3"
 LOGO_PATH = ASSETS_DIR / "logo.png"
@@ -40,9 +44,18 @@ EXCEL_PATH = Path("riddles.xlsx")
 OUTPUT_DIR = Path("outputs")
 OUTPUT_DIR.mkdir(exist_ok=True)
 VOICE_LANG = "en"
+PIPER_BIN = os.environ.get("PIPER_BINARY", "piper")
+PIPER_VOICE = Path(os.environ.get("PIPER_VOICE", ASSETS_DIR / "voices" / "en_US-amy-medium.onnx"))
+TTS_CACHE_DIR = Path(".cache") / "tts"
+FFMPEG_BIN = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BIN = os.environ.get("FFPROBE_BINARY", "ffprobe")
+FPS = 24
 
 TOKEN_URI = "https://oauth2.googleapis.com/token"
 SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_TIMEOUT = 30
+UPLOAD_MAX_RETRIES = 10
 
 # Slide durations
 HOOK_DURATION = 3.0
@@ -51,6 +64,7 @@ OPTIONS_DURATION = 5.0
 ANSWER_DURATION = 3.0
 FADE = 0.35
 PADDING_AFTER_AUDIO = 0.5
+MUSIC_VOLUME = 0.12
 
 # Text styling
 TITLE_FONT_SIZE = 72
@@ -60,103 +74,187 @@ OPTION_FONT_SIZE = 48
 ANSWER_FONT_SIZE = 64
 TEXT_COLOR = "white"
 TEXT_MARGIN = 80
+OUTLINE_WIDTH = 2
 
 # ---------------- Helpers ----------------
-def pick_background_clip(duration):
+def pick_background_input(tmp_dir):
+    # Returns the ffmpeg input args and the filters that turn it into a WIDTHxHEIGHT, FPS stream
     vids = list(glob.glob(str(BG_VIDEO_GLOB)))
     if vids:
-        path = random.choice(vids)
-        clip = VideoFileClip(path).resize(height=HEIGHT)
-        clip = clip.fx(lambda c: c.crop(x1=0, y1=0, x2=c.w, y2=c.h)) if clip.w != WIDTH else clip
-        if clip.duration < duration:
-            loops = math.ceil(duration / clip.duration)
-            clips = [clip] * loops
-            clip = concatenate_videoclips(clips).set_duration(duration)
-        else:
-            clip = clip.subclip(0, duration)
-        return clip.resize((WIDTH, HEIGHT))
+        path = cached_background(random.choice(vids))
+        return ["-stream_loop", "-1", "-i", str(path)], "setsar=1"
 
     if BG_IMAGE.exists():
-        img = Image.open(BG_IMAGE)
-        img = img.resize((WIDTH, HEIGHT), Image.Resampling.LANCZOS)
-        tmp = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-        img.save(tmp.name)
-        tmp.close()
-        return ImageClip(tmp.name).set_duration(duration)
-
-    img = Image.new("RGB", (WIDTH, HEIGHT), color=(20, 20, 25))
-    tmp = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-    img.save(tmp.name)
-    tmp.close()
-    return ImageClip(tmp.name).set_duration(duration)
-
-def pick_music_clip(duration):
+        arr = cv2.imread(str(BG_IMAGE))
+        # One cover resize, then a centre crop (same as scale=...:force_original_aspect_ratio=increase,crop=...)
+        h, w = arr.shape[:2]
+        scale = max(WIDTH / w, HEIGHT / h)
+        new_w, new_h = max(WIDTH, round(w * scale)), max(HEIGHT, round(h * scale))
+        interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+        arr = cv2.resize(arr, (new_w, new_h), interpolation=interp)
+        x, y = (new_w - WIDTH) // 2, (new_h - HEIGHT) // 2
+        arr = arr[y:y + HEIGHT, x:x + WIDTH]
+        path = Path(tmp_dir) / "bg.png"
+        cv2.imwrite(str(path), arr)
+        # Decode the still once and repeat that frame instead of re-reading the file every frame
+        return ["-i", str(path)], f"loop=loop=-1:size=1,setpts=N/{FPS}/TB,setsar=1"
+
+    return ["-f", "lavfi", "-i", f"color=c=0x141419:s={WIDTH}x{HEIGHT}:r={FPS}"], "setsar=1"
+
+def cached_background(src):
+    # Scale/crop each background to WIDTHxHEIGHT at FPS once and reuse it on later runs
+    digest = hashlib.sha1()
+    with open(src, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    key = digest.hexdigest()
+    out_path = BG_CACHE_DIR / f"{key}_{WIDTH}x{HEIGHT}.mp4"
+    if out_path.exists():
+        return out_path
+
+    BG_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(".part.mp4")
+    vf = f"scale={WIDTH}:{HEIGHT}:force_original_aspect_ratio=increase,crop={WIDTH}:{HEIGHT},setsar=1,fps={FPS}"
+    cmd = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-y", "-i", str(src), "-vf", vf, "-an", "-pix_fmt", "yuv420p"]
+    subprocess.run(cmd + encoder_args(cq=18) + [str(tmp_path)], check=True)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+def pick_music_path():
     files = list(glob.glob(str(MUSIC_GLOB)))
     if not files:
         return None
-    path = random.choice(files)
-    music = AudioFileClip(path)
-    if music.duration < duration:
-        loops = math.ceil(duration / music.duration)
-        from moviepy.editor import concatenate_audioclips
-        music = concatenate_audioclips([music] * loops).set_duration(duration)
-    else:
-        music = music.subclip(0, duration)
-    return music.volumex(0.12)
-
-def text_size(draw, text, font):
-    bbox = draw.textbbox((0, 0), text, font=font)
-    width = bbox[2] - bbox[0]
-    height = bbox[3] - bbox[1]
-    return width, height
-
-def render_text_image(text, fontsize, size=(WIDTH, HEIGHT), align="center"):
-    img = Image.new("RGBA", size, (0, 0, 0, 0))
-    draw = ImageDraw.Draw(img)
+    return random.choice(files)
+
+@lru_cache(maxsize=1)
+def font_file():
+    # drawtext needs an actual file, so resolve a fallback through fontconfig when FONT_PATH is missing.
+    # Wrapping is measured with the same file, so there is no safe default to fall back to
+    if FONT_PATH.exists():
+        return str(FONT_PATH)
     try:
-        font = ImageFont.truetype(str(FONT_PATH), fontsize) if Path(FONT_PATH).exists() else ImageFont.truetype("arial.ttf", fontsize)
-    except Exception:
-        font = ImageFont.load_default()
-
-    maxw = size[0] - 2 * TEXT_MARGIN
-    words = str(text).split()
+        out = subprocess.run(["fc-match", "-f", "%{file}", "sans:bold"], capture_output=True, text=True)
+        path = out.stdout.strip()
+    except OSError:
+        path = ""
+    if not path:
+        raise FileNotFoundError(f"{FONT_PATH} not found and fontconfig has no fallback font.")
+    return path
+
+@lru_cache(maxsize=16)
+def _get_font(path, size):
+    return ImageFont.truetype(path, size)
+
+@lru_cache(maxsize=16)
+def _line_height(path, size):
+    ascent, descent = _get_font(path, size).getmetrics()
+    return ascent + descent
+
+@lru_cache(maxsize=64)
+def wrap_text(text, fontsize, maxw):
+    font = _get_font(font_file(), fontsize)
+    space_w = font.getlength(" ")
     lines = []
-    cur = ""
-    for w in words:
-        test = (cur + " " + w).strip()
-        wsize, _ = text_size(draw, test, font)
-        if wsize <= maxw:
-            cur = test
+    cur = []
+    cur_w = 0.0
+    for word in str(text).split():
+        word_w = font.getlength(word)
+        test_w = cur_w + space_w + word_w if cur else word_w
+        if test_w <= maxw or not cur:
+            cur.append(word)
+            cur_w = test_w
         else:
-            lines.append(cur)
-            cur = w
+            lines.append(" ".join(cur))
+            cur = [word]
+            cur_w = word_w
     if cur:
-        lines.append(cur)
-
-    _, line_h = text_size(draw, "Ay", font)
-    line_h += 8
-    total_h = line_h * len(lines)
-    y = (size[1] - total_h) // 2
-
-    for line in lines:
-        w, h = text_size(draw, line, font)
-        x = (size[0] - w) // 2 if align == "center" else TEXT_MARGIN
-        # outline
-        draw.text((x-2, y-2), line, font=font, fill="black")
-        draw.text((x+2, y-2), line, font=font, fill="black")
-        draw.text((x-2, y+2), line, font=font, fill="black")
-        draw.text((x+2, y+2), line, font=font, fill="black")
-        draw.text((x, y), line, font=font, fill=TEXT_COLOR)
-        y += line_h
-
-    tmp = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-    img.save(tmp.name)
-    tmp.close()
-    return tmp.name
-
-def tts_save(text, out_path):
-    tts = gTTS(text=text, lang=VOICE_LANG)
-    tts.save(out_path)
+        lines.append(" ".join(cur))
+    return tuple(lines)
+
+def drawtext_filters(text, fontsize, start, end, tmp_dir, slide):
+    # One drawtext per wrapped line so every line is centred on its own
+    lines = wrap_text(str(text), fontsize, WIDTH - 2 * TEXT_MARGIN)
+    line_h = _line_height(font_file(), fontsize)
+    top = (HEIGHT - line_h * len(lines)) // 2
+    filters = []
+    for i, line in enumerate(lines):
+        # textfile avoids having to escape the riddle text for the filtergraph
+        text_path = Path(tmp_dir) / f"slide_{slide}_{i}.txt"
+        text_path.write_text(line, encoding="utf-8")
+        opts = [
+            f"fontfile='{Path(font_file()).as_posix()}'",
+            f"textfile='{text_path.as_posix()}'",
+            "expansion=none",
+            f"fontsize={fontsize}",
+            f"fontcolor={TEXT_COLOR}",
+            f"borderw={OUTLINE_WIDTH}",
+            "bordercolor=black",
+            "x=(w-text_w)/2",
+            f"y={top + i * line_h}",
+            f"enable='gte(t,{start})*lt(t,{end})'",
+        ]
+        filters.append("drawtext=" + ":".join(opts))
+    return filters
+
+def save_logo_png(width, path):
+    arr = cv2.imread(str(LOGO_PATH), cv2.IMREAD_UNCHANGED)
+    if arr.ndim == 2:
+        arr = cv2.cvtColor(arr, cv2.COLOR_GRAY2BGRA)
+    elif arr.shape[2] == 3:
+        arr = cv2.cvtColor(arr, cv2.COLOR_BGR2BGRA)
+    # Keep the aspect ratio at the requested width
+    scale = width / float(arr.shape[1])
+    height = int(arr.shape[0] * scale)
+    # INTER_AREA only helps when shrinking; it degrades to nearest-neighbour when enlarging
+    interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    arr = cv2.resize(arr, (width, height), interpolation=interp)
+    cv2.imwrite(str(path), arr)
+    return str(path)
+
+@lru_cache(maxsize=1)
+def nvenc_available():
+    # The encoder can be compiled into ffmpeg without a usable GPU, so probe with a tiny encode
+    ffmpeg = shutil.which(FFMPEG_BIN)
+    if not ffmpeg:
+        return False
+    cmd = [ffmpeg, "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.1", "-c:v", "h264_nvenc", "-f", "null", "-"]
+    try:
+        return subprocess.run(cmd, capture_output=True, timeout=30).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+def encoder_args(cq=23):
+    if nvenc_available():
+        return ["-c:v", "h264_nvenc", "-preset", "p4", "-rc", "vbr", "-cq", str(cq), "-b:v", "4M"]
+    return ["-c:v", "libx264", "-preset", "ultrafast", "-crf", str(cq)]
+
+def probe_duration(path):
+    cmd = [FFPROBE_BIN, "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", str(path)]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip())
+
+def tts_save(text):
+    # Prefer the local piper model; gTTS is only used when piper or the voice is missing
+    use_piper = shutil.which(PIPER_BIN) is not None and PIPER_VOICE.exists()
+    voice = PIPER_VOICE.name if use_piper else f"gtts-{VOICE_LANG}"
+    key = hashlib.sha1(f"{voice}\n{text}".encode("utf-8")).hexdigest()
+    out_path = TTS_CACHE_DIR / (key + (".wav" if use_piper else ".mp3"))
+    if out_path.exists():
+        return out_path
+
+    TTS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(".part")
+    if use_piper:
+        cmd = [PIPER_BIN, "--model", str(PIPER_VOICE), "--output_file", str(tmp_path)]
+        # piper is chatty on stderr, so keep it out of the log unless the run fails
+        try:
+            subprocess.run(cmd, input=text.encode("utf-8"), check=True, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"piper failed: {e.stderr.decode('utf-8', 'replace').strip()}") from e
+    else:
+        gTTS(text=text, lang=VOICE_LANG).save(str(tmp_path))
+    os.replace(tmp_path, out_path)
+    return out_path
 
 def get_credentials_from_refresh_token(client_id, client_secret, refresh_token):
     data = {
@@ -180,9 +278,47 @@ def get_credentials_from_refresh_token(client_id, client_secret, refresh_token):
         scopes=SCOPES,
     )
 
+class PrefetchingMediaFileUpload(MediaFileUpload):
+    # Reads chunk N+1 on a background thread while chunk N is being sent, so disk reads
+    # overlap the network instead of stalling between chunks
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, **kwargs)
+        self._read_lock = threading.Lock()
+        self._prefetcher = ThreadPoolExecutor(max_workers=1)
+        self._prefetched = {}
+
+    def has_stream(self):
+        # Force the client to go through getbytes() instead of slicing the file object itself
+        return False
+
+    def _read(self, begin, length):
+        with self._read_lock:
+            self._fd.seek(begin)
+            return self._fd.read(length)
+
+    def getbytes(self, begin, length):
+        fut = self._prefetched.pop((begin, length), None)
+        data = fut.result() if fut else self._read(begin, length)
+        # Anything else queued is stale, e.g. the server acknowledged only part of a chunk
+        self._prefetched.clear()
+        next_begin = begin + len(data)
+        if len(data) == length and next_begin < self.size():
+            self._prefetched[(next_begin, length)] = self._prefetcher.submit(self._read, next_begin, length)
+        return data
+
+    def to_json(self):
+        # The lock and executor can't be serialised; from_json() rebuilds them through __init__
+        return self._to_json(strip=["_fd", "_read_lock", "_prefetcher", "_prefetched"])
+
+    def close(self):
+        self._prefetched.clear()
+        self._prefetcher.shutdown(wait=True)
+
 def upload_to_youtube(video_file, title, description, credentials, tags=None, privacy="public"):
-    youtube = build("youtube", "v3", credentials=credentials, cache_discovery=False)
-    media = MediaFileUpload(video_file, chunksize=-1, resumable=True, mimetype="video/*")
+    socket.setdefaulttimeout(UPLOAD_TIMEOUT)
+    http = AuthorizedHttp(credentials, http=httplib2.Http(cache=None, timeout=UPLOAD_TIMEOUT))
+    youtube = build("youtube", "v3", http=http, static_discovery=True)
+    media = PrefetchingMediaFileUpload(video_file, chunksize=UPLOAD_CHUNK_SIZE, resumable=True, mimetype="video/*")
     request = youtube.videos().insert(
         part="snippet,status",
         body={
@@ -192,18 +328,25 @@ def upload_to_youtube(video_file, title, description, credentials, tags=None, pr
         media_body=media,
     )
     response = None
-    while response is None:
-        status, response = request.next_chunk()
-        if status:
-            print(f"Upload progress: {int(status.progress() * 100)}%")
+    try:
+        while response is None:
+            # The client retries 5xx, 429, rate-limit 403s and socket errors with exponential backoff
+            status, response = request.next_chunk(num_retries=UPLOAD_MAX_RETRIES)
+            if status:
+                print(f"Upload progress: {int(status.progress() * 100)}%")
+    finally:
+        media.close()
     return response
 
 # ---------------- Core flow ----------------
+def _normalize_column(name):
+    return str(name).strip().replace(" ", "_").lower()
+
 def load_next_riddle():
     if not EXCEL_PATH.exists():
         raise FileNotFoundError(f"{EXCEL_PATH} not found.")
     df = pd.read_excel(EXCEL_PATH, engine="openpyxl")
-    df.columns = [c.strip().replace(" ", "_").lower() for c in df.columns]
+    df.columns = [_normalize_column(c) for c in df.columns]
     # Ensure required columns exist
     for n in ["title", "hook", "body", "option_1", "option_2", "option_3", "answer"]:
         if n not in df.columns:
@@ -211,15 +354,26 @@ def load_next_riddle():
     if "uploaded" not in df.columns:
         df["uploaded"] = False
 
-    for idx, row in df.iterrows():
-        v = row.get("uploaded")
-        if not (str(v).strip().lower() in ["true", "1"]):
-            return df, idx, row
-    return df, None, None
-
-def mark_uploaded_and_save(df, idx):
-    df.at[idx, "uploaded"] = True
-    df.to_excel(EXCEL_PATH, index=False, engine="openpyxl")
+    pending = ~df["uploaded"].astype(str).str.strip().str.lower().isin(["true", "1", "1.0"])
+    if not pending.any():
+        return df, None, None
+    idx = pending.idxmax()
+    return df, idx, df.loc[idx]
+
+def mark_uploaded_and_save(idx):
+    # Update the single cell in place rather than re-serialising the whole sheet
+    wb = load_workbook(EXCEL_PATH)
+    # pd.read_excel reads the first sheet, so write to that one rather than whichever is active
+    ws = wb.worksheets[0]
+    headers = [_normalize_column(c.value) if c.value is not None else None for c in ws[1]]
+    if "uploaded" in headers:
+        col = headers.index("uploaded") + 1
+    else:
+        col = len(headers) + 1
+        ws.cell(row=1, column=col).value = "uploaded"
+    # pandas row idx sits below the header row, assuming the sheet has no blank rows
+    ws.cell(row=idx + 2, column=col).value = True
+    wb.save(EXCEL_PATH)
 
 def build_short_and_upload(riddle_row, idx, creds, privacy="public"):
     hook = str(riddle_row.get("hook", ""))
@@ -230,68 +384,70 @@ def build_short_and_upload(riddle_row, idx, creds, privacy="public"):
     answer = str(riddle_row.get("answer", ""))
     title_text = str(riddle_row.get("title", f"Riddle #{idx}"))
 
-    total_audio_length = HOOK_DURATION + BODY_DURATION + OPTIONS_DURATION + ANSWER_DURATION + PADDING_AFTER_AUDIO
-    bg_clip = pick_background_clip(total_audio_length)
-
-    # Render slides
-    hook_img = render_text_image(hook, HOOK_FONT_SIZE)
-    body_img = render_text_image(body, BODY_FONT_SIZE)
-    options_img = render_text_image(f"A) {opt1}\nB) {opt2}\nC) {opt3}", OPTION_FONT_SIZE)
-    answer_img = render_text_image("Answer: " + answer, ANSWER_FONT_SIZE)
-
-    hook_clip = ImageClip(hook_img).set_duration(HOOK_DURATION)
-    body_clip = ImageClip(body_img).set_duration(BODY_DURATION)
-    options_clip = ImageClip(options_img).set_duration(OPTIONS_DURATION)
-    answer_clip = ImageClip(answer_img).set_duration(ANSWER_DURATION)
-
-    slides = []
-    for slide_clip in [hook_clip, body_clip, options_clip, answer_clip]:
-        sub_bg = bg_clip.subclip(0, slide_clip.duration).set_duration(slide_clip.duration)
-        comp = CompositeVideoClip([sub_bg, slide_clip.set_position(("center", "center"))]).fadein(FADE).fadeout(FADE)
-        slides.append(comp)
-
-    video = concatenate_videoclips(slides, method="compose")
-
-    if Path(LOGO_PATH).exists():
-        # Resize logo manually using Pillow
-        if Path(LOGO_PATH).exists():
-            logo_img = Image.open(LOGO_PATH)
-            # Calculate new height to maintain aspect ratio
-            w_percent = 140 / float(logo_img.width)
-            h_size = int(float(logo_img.height) * w_percent)
-            logo_img = logo_img.resize((140, h_size), Image.Resampling.LANCZOS)
-            
-            tmp_logo = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-            logo_img.save(tmp_logo.name)
-            tmp_logo.close()
-        
-            logo = ImageClip(tmp_logo.name).set_duration(video.duration).set_pos(("right", "top")).margin(right=32, top=32)
-
-        video = CompositeVideoClip([video, logo])
+    slides = [
+        (hook, HOOK_FONT_SIZE, HOOK_DURATION),
+        (body, BODY_FONT_SIZE, BODY_DURATION),
+        (f"A) {opt1}\nB) {opt2}\nC) {opt3}", OPTION_FONT_SIZE, OPTIONS_DURATION),
+        ("Answer: " + answer, ANSWER_FONT_SIZE, ANSWER_DURATION),
+    ]
+    slides_length = sum(duration for _, _, duration in slides)
+    out_path = OUTPUT_DIR / f"riddle_short_{idx}_{int(time.time())}.mp4"
 
     tts_text = f"{hook}. {body}. Option A: {opt1}. Option B: {opt2}. Option C: {opt3}. The answer is {answer}."
-    tts_tmp = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
-    tts_save(tts_text, tts_tmp.name)
-    tts_tmp.close()
-    voice_audio = AudioFileClip(tts_tmp.name)
-
-    music = pick_music_clip(voice_audio.duration + PADDING_AFTER_AUDIO)
-    if music:
-        from moviepy.editor import CompositeAudioClip
-        final_audio = CompositeAudioClip([voice_audio, music.set_duration(voice_audio.duration + PADDING_AFTER_AUDIO)]).set_duration(voice_audio.duration + PADDING_AFTER_AUDIO)
-    else:
-        final_audio = voice_audio
 
-    if video.duration < final_audio.duration:
-        video = video.set_duration(final_audio.duration)
-    video = video.set_audio(final_audio)
-
-    out_path = OUTPUT_DIR / f"riddle_short_{idx}_{int(time.time())}.mp4"
-    video.write_videofile(str(out_path), fps=24, codec="libx264", audio_codec="aac", threads=0, remove_temp=True)
+    with tempfile.TemporaryDirectory() as tmp_dir, ThreadPoolExecutor(max_workers=3) as ex:
+        # Run TTS (a network round-trip when falling back to gTTS) alongside the local image preparation
+        fut_tts = ex.submit(tts_save, tts_text)
+        fut_bg = ex.submit(pick_background_input, tmp_dir)
+        fut_logo = ex.submit(save_logo_png, 140, Path(tmp_dir) / "logo.png") if Path(LOGO_PATH).exists() else None
+
+        voice_path = fut_tts.result()
+        audio_length = probe_duration(voice_path) + PADDING_AFTER_AUDIO
+        total_length = max(slides_length, audio_length)
+
+        # One ffmpeg run does the whole edit. The background is decoded once as a continuous
+        # stream; each slide's text is drawn with drawtext and faded only within its own time
+        # window, and the last fade-out is left open so any tail past the slides stays black
+        inputs, bg_filters = fut_bg.result()
+        filters = [bg_filters, f"trim=duration={total_length}"]
+        fades = []
+        start = 0.0
+        for i, (text, fontsize, duration) in enumerate(slides):
+            end = start + duration
+            filters += drawtext_filters(text, fontsize, start, end, tmp_dir, i)
+            fade_out = f"fade=t=out:st={end - FADE}:d={FADE}"
+            if i < len(slides) - 1:
+                fade_out += f":enable='between(t,{end - FADE},{end})'"
+            fades += [f"fade=t=in:st={start}:d={FADE}:enable='between(t,{start},{start + FADE})'", fade_out]
+            start = end
+        graph = ["[0:v]" + ",".join(filters + fades) + "[slides]"]
+        n_inputs = 1
+        video_label = "slides"
+
+        if fut_logo:
+            inputs += ["-i", fut_logo.result()]
+            graph.append(f"[{video_label}][{n_inputs}:v]overlay=W-w-32:32:enable='lt(t,{slides_length})'[logo]")
+            video_label = "logo"
+            n_inputs += 1
+
+        inputs += ["-i", str(voice_path)]
+        graph.append(f"[{n_inputs}:a]apad=whole_dur={audio_length}[voice]")
+        n_inputs += 1
+        music_path = pick_music_path()
+        if music_path:
+            inputs += ["-stream_loop", "-1", "-i", music_path]
+            graph.append(f"[{n_inputs}:a]atrim=0:{audio_length}[music]")
+            graph.append(f"[voice][music]amix=inputs=2:duration=first:weights='1 {MUSIC_VOLUME}':normalize=0[audio]")
+            audio_label = "audio"
+        else:
+            audio_label = "voice"
 
-    for f in [hook_img, body_img, options_img, answer_img, tts_tmp.name]:
-        try: os.remove(f)
-        except Exception: pass
+        cmd = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-stats", "-y"] + inputs + [
+            "-filter_complex", ";".join(graph),
+            "-map", f"[{video_label}]", "-map", f"[{audio_label}]",
+            "-t", str(total_length), "-r", str(FPS), "-pix_fmt", "yuv420p",
+        ] + encoder_args() + ["-threads", str(os.cpu_count()), "-c:a", "aac", str(out_path)]
+        subprocess.run(cmd, check=True)
 
     vid_title = f"{title_text} — Quick Riddle"
     description = f"{hook}\n\n{body}\n\nOptions:\nA) {opt1}\nB) {opt2}\nC) {opt3}\n\nAnswer: {answer}\n\n#riddle #shorts"
@@ -307,7 +463,7 @@ def main():
     if not (YT_CLIENT_ID and YT_CLIENT_SECRET and YT_REFRESH_TOKEN):
         raise EnvironmentError("Set YT_CLIENT_ID, YT_CLIENT_SECRET, YT_REFRESH_TOKEN env vars.")
 
-    df, idx, row = load_next_riddle()
+    _, idx, row = load_next_riddle()
     if idx is None:
         print("No more unridden riddles found. Exiting.")
         return
@@ -318,7 +474,7 @@ def main():
     resp = build_short_and_upload(row, idx, creds, privacy=PRIVACY)
     print("Upload response:", resp)
 
-    mark_uploaded_and_save(df, idx)
+    mark_uploaded_and_save(idx)
     print(f"Marked row {idx} as Uploaded and saved {EXCEL_PATH}")
 
 if __name__ == "__main__":